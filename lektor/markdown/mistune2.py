@@ -16,7 +16,6 @@ import mistune  # type: ignore[import]
 from lektor.markdown.controller import MarkdownController
 from lektor.markdown.controller import RendererHelper
 from lektor.markdown.controller import UnknownPluginError
-from lektor.utils import unique_everseen
 
 
 class ImprovedRenderer(mistune.HTMLRenderer):  # type: ignore[misc]
@@ -85,7 +84,7 @@ class MarkdownController2(MarkdownController):
         if plugins:
             # Resolve and filter out duplicates
             parser_options["plugins"] = tuple(
-                unique_everseen(map(self.resolve_plugin, plugins))
+                dict.fromkeys(map(self.resolve_plugin, plugins))
             )
         return mistune.Markdown(renderer, **cfg.parser_options)
 
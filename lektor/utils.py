@@ -12,7 +12,6 @@ import unicodedata
 import uuid
 import warnings
 from contextlib import contextmanager
-from dataclasses import dataclass
 from datetime import datetime
 from functools import lru_cache
 from functools import wraps
@@ -36,8 +35,15 @@ from werkzeug.urls import url_parse
 is_windows = os.name == "nt"
 
 _slash_escape = "\\/" not in json.dumps("/")
+_htmlsafe_json_escapes = (
+    ("<", "\\u003c"),
+    (">", "\\u003e"),
+    ("&", "\\u0026"),
+    ("'", "\\u0027"),
+)
 
 _last_num_re = re.compile(r"^(.*)(\d+)(.*?)$")
+_slug_safe_re = re.compile(r"\A[A-Za-z0-9]+(?:-[A-Za-z0-9]+)*\Z")
 _list_marker = object()
 _value_marker = object()
 
@@ -51,8 +57,9 @@ except LookupError:
 
 
 def split_virtual_path(path):
-    if "@" in path:
-        return path.split("@", 1)
+    head, sep, tail = path.partition("@")
+    if sep:
+        return head, tail
     return path, None
 
 
@@ -61,8 +68,10 @@ def _norm_join(a, b):
 
 
 def join_path(a, b):
-    a_p, a_v = split_virtual_path(a)
-    b_p, b_v = split_virtual_path(b)
+    # NB: this is split_virtual_path inlined; the virtual paths are only
+    # checked for truthiness, so an empty one is as good as None.
+    a_p, _, a_v = a.partition("@")
+    b_p, _, b_v = b.partition("@")
 
     # Special case: paginations are considered special virtual paths
     # where the parent is the actual parent of the page.  This however
@@ -86,7 +95,12 @@ def join_path(a, b):
 def cleanup_path(path):
     # NB: POSIX allows for two leading slashes in a pathname, so we have to
     # deal with the possiblity of leading double-slash ourself.
-    return posixpath.normpath("/" + path.lstrip("/"))
+    path = "/" + path.lstrip("/")
+    # Most paths we see are already normalized.  Only bother with normpath
+    # if there might be empty, "." or ".." segments or a trailing slash.
+    if "//" in path or "/." in path or path[-1] == "/":
+        return posixpath.normpath(path)
+    return path
 
 
 def cleanup_url_path(url_path):
@@ -104,46 +118,55 @@ def cleanup_url_path(url_path):
     if netloc:
         raise ValueError(f"Invalid netloc: {url_path!r}")
 
-    # NB: POSIX allows for two leading slashes in a pathname, so we have to
-    # deal with the possiblity of leading double-slash ourself.
-    return posixpath.normpath("/" + path.lstrip("/"))
+    return cleanup_path(path)
 
 
 def parse_path(path):
-    x = cleanup_path(path).strip("/").split("/")
-    if x == [""]:
+    # cleanup_path leaves exactly one leading slash and no empty segments
+    path = cleanup_path(path)
+    if path == "/":
         return []
-    return x
+    return path[1:].split("/")
+
+
+def _is_strict_path_prefix(child, parent):
+    # Both paths must have been normalized by cleanup_path.
+    return child != parent and (parent == "/" or child.startswith(parent + "/"))
 
 
 def is_path_child_of(a, b, strict=True):
     a_p, a_v = split_virtual_path(a)
     b_p, b_v = split_virtual_path(b)
-    a_p = parse_path(a_p)
-    b_p = parse_path(b_p)
-    a_v = parse_path(a_v or "")
-    b_v = parse_path(b_v or "")
+    a_p = cleanup_path(a_p)
+    b_p = cleanup_path(b_p)
+    a_v = cleanup_path(a_v or "")
+    b_v = cleanup_path(b_v or "")
 
     if not strict and a_p == b_p and a_v == b_v:
         return True
-    if not a_v and b_v:
+    if a_v == "/" and b_v != "/":
         return False
-    if a_p == b_p and a_v[: len(b_v)] == b_v and len(a_v) > len(b_v):
+    if a_p == b_p and _is_strict_path_prefix(a_v, b_v):
         return True
-    return a_p[: len(b_p)] == b_p and len(a_p) > len(b_p)
+    return _is_strict_path_prefix(a_p, b_p)
 
 
-def untrusted_to_os_path(path):
-    path = path.strip("/").replace("/", os.path.sep)
-    if not isinstance(path, str):
-        path = path.decode(fs_enc, "replace")
-    return path
+if os.path.sep == "/":
+
+    def untrusted_to_os_path(path):
+        return path.strip("/")
+
+else:
+
+    def untrusted_to_os_path(path):
+        return path.strip("/").replace("/", os.path.sep)
 
 
 def is_path(path):
     return os.path.sep in path or (os.path.altsep and os.path.altsep in path)
 
 
+@lru_cache(maxsize=8192, typed=True)
 def magic_split_ext(filename, ext_check=True):
     """Splits a filename into base and extension.  If ext check is enabled
     (which is the default) then it verifies the extension is at least
@@ -182,9 +205,14 @@ def iter_dotted_path_prefixes(dotted_path):
             yield ".".join(pieces[:x]), ".".join(pieces[x:])
 
 
+@lru_cache(maxsize=2048)
+def _split_dotted_path(dotted_path):
+    return tuple(dotted_path.split("."))
+
+
 def resolve_dotted_value(obj, dotted_path):
     node = obj
-    for key in dotted_path.split("."):
+    for key in _split_dotted_path(dotted_path):
         if isinstance(node, dict):
             new_node = node.get(key)
             if new_node is None and key.isdigit():
@@ -202,35 +230,46 @@ def resolve_dotted_value(obj, dotted_path):
     return node
 
 
-def decode_flat_data(itemiter, dict_cls=dict):
-    def _split_key(name):
-        result = name.split(".")
-        for idx, part in enumerate(result):
-            if part.isdigit():
-                result[idx] = int(part)
-        return result
+@lru_cache(maxsize=4096)
+def _split_key(name):
+    # NB: the result is cached and shared, so it must be immutable
+    return tuple(int(part) if part.isdigit() else part for part in name.split("."))
+
 
+def decode_flat_data(itemiter, dict_cls=dict):
     def _enter_container(container, key):
         if key not in container:
             return container.setdefault(key, dict_cls())
         return container[key]
 
-    def _convert(container):
-        if _value_marker in container:
-            force_list = False
-            values = container.pop(_value_marker)
-            if container.pop(_list_marker, False):
-                force_list = True
-                values.extend(_convert(x[1]) for x in sorted(container.items()))
-            if not force_list and len(values) == 1:
-                values = values[0]
-
-            if not container:
-                return values
-            return _convert(container)
-        if container.pop(_list_marker, False):
-            return [_convert(x[1]) for x in sorted(container.items())]
-        return dict_cls((k, _convert(v)) for k, v in container.items())
+    def _finish(container, children):
+        values = container.pop(_value_marker, None)
+        is_list = container.pop(_list_marker, False)
+        if not children:
+            if values is None:
+                return children
+            return values[0] if len(values) == 1 else values
+        if is_list and values is None:
+            return [children[key] for key in sorted(children)]
+        return children
+
+    def _convert(root):
+        # Post-order walk with an explicit stack so that deeply nested keys
+        # do not run into the recursion limit.
+        rv = None
+        stack = [(None, root, iter(root.items()), dict_cls())]
+        while stack:
+            _, container, pending, children = stack[-1]
+            for key, value in pending:
+                if key is not _value_marker and key is not _list_marker:
+                    stack.append((key, value, iter(value.items()), dict_cls()))
+                    break
+            else:
+                key = stack.pop()[0]
+                rv = _finish(container, children)
+                if stack:
+                    stack[-1][3][key] = rv
+        return rv
 
     result = dict_cls()
 
@@ -248,22 +287,39 @@ def decode_flat_data(itemiter, dict_cls=dict):
     return _convert(result)
 
 
+def _merge_items(a, b):
+    """Yield ``(container, key, value_1, value_2)`` for the items of ``a``
+    and ``b`` that ``merge`` has to combine, in order."""
+    if isinstance(a, list) and isinstance(b, list):
+        for idx, (item_1, item_2) in enumerate(zip(a, b)):
+            yield a, idx, item_1, item_2
+    elif isinstance(a, dict) and isinstance(b, dict):
+        for key, value in b.items():
+            yield a, key, a.get(key), value
+
+
 def merge(a, b):
     """Merges two values together."""
-    if b is None and a is not None:
-        return a
     if a is None:
         return b
-    if isinstance(a, list) and isinstance(b, list):
-        for idx, (item_1, item_2) in enumerate(zip(a, b)):
-            a[idx] = merge(item_1, item_2)
-    if isinstance(a, dict) and isinstance(b, dict):
-        for key, value in b.items():
-            a[key] = merge(a.get(key), value)
-        return a
+    # Merge nested containers in place using an explicit stack of item
+    # iterators rather than recursion.  Items are visited depth-first and in
+    # order, just as the recursive version did.  Non-None values in ``a``
+    # always win, so only the ``None`` slots ever need to be written back.
+    stack = [_merge_items(a, b)]
+    while stack:
+        for container, key, value_1, value_2 in stack[-1]:
+            if value_1 is None:
+                container[key] = value_2
+            elif value_2 is not None:
+                stack.append(_merge_items(value_1, value_2))
+                break
+        else:
+            stack.pop()
     return a
 
 
+@lru_cache(maxsize=8192, typed=True)
 def slugify(text):
     """
     A wrapper around python-slugify which preserves file extensions
@@ -281,9 +337,18 @@ def slugify(text):
 
 
 def secure_filename(filename, fallback_name="file"):
+    return _secure_filename(filename, fallback_name)
+
+
+@lru_cache(maxsize=8192, typed=True)
+def _secure_filename(filename, fallback_name):
     base = filename.replace("/", " ").replace("\\", " ")
     basename, ext = magic_split_ext(base)
-    rv = slugify(basename).lstrip(".")
+    if _slug_safe_re.match(basename):
+        # Fast path: slugifying this would only lowercase it.
+        rv = basename.lower()
+    else:
+        rv = slugify(basename).lstrip(".")
     if not rv:
         rv = fallback_name
     if ext:
@@ -308,17 +373,22 @@ def increment_filename(filename):
     return rv
 
 
-@lru_cache(maxsize=None)
 def locate_executable(exe_file, cwd=None, include_bundle_path=True):
     """Locates an executable in the search path."""
-    choices = [exe_file]
-    resolve = True
+    # The search path is part of the cache key, so changes to $PATH (or
+    # to the current directory, on Windows) are picked up automatically.
+    if os.name == "nt":
+        cwd = cwd or os.getcwd()
+    else:
+        cwd = None
+    return _locate_executable(
+        exe_file, cwd, os.environ.get("PATH", ""), os.environ.get("PATHEXT", "")
+    )
 
-    # If it's already a path, we don't resolve.
-    if os.path.sep in exe_file or (os.path.altsep and os.path.altsep in exe_file):
-        resolve = False
 
-    extensions = os.environ.get("PATHEXT", "").split(";")
+@lru_cache(maxsize=1024)
+def _locate_executable(exe_file, cwd, search_path, pathext):
+    extensions = pathext.split(";")
     _, ext = os.path.splitext(exe_file)
     if (
         os.name != "nt"
@@ -327,12 +397,16 @@ def locate_executable(exe_file, cwd=None, include_bundle_path=True):
     ):
         extensions.insert(0, "")
 
-    if resolve:
-        paths = os.environ.get("PATH", "").split(os.pathsep)
-        choices = [os.path.join(path, exe_file) for path in paths]
+    # If it's already a path, we don't resolve.
+    if is_path(exe_file):
+        choices = [exe_file]
+    else:
+        choices = [
+            os.path.join(path, exe_file) for path in search_path.split(os.pathsep)
+        ]
 
-    if os.name == "nt":
-        choices.append(os.path.join((cwd or os.getcwd()), exe_file))
+    if cwd is not None:
+        choices.append(os.path.join(cwd, exe_file))
 
     try:
         for path in choices:
@@ -344,14 +418,27 @@ def locate_executable(exe_file, cwd=None, include_bundle_path=True):
         return None
 
 
+# The cache now lives on _locate_executable; keep the old entry point (used by
+# the no_utils fixture in tests/conftest.py) working.
+locate_executable.cache_clear = _locate_executable.cache_clear
+
+
+_json_encoders = {
+    datetime: http_date,
+    uuid.UUID: str,
+}
+
+
 class JSONEncoder(json.JSONEncoder):
     def default(self, o):  # pylint: disable=method-hidden
+        encode = _json_encoders.get(type(o))
+        if encode is not None:
+            return encode(o)
         if is_undefined(o):
             return None
-        if isinstance(o, datetime):
-            return http_date(o)
-        if isinstance(o, uuid.UUID):
-            return str(o)
+        for cls, encode in _json_encoders.items():
+            if isinstance(o, cls):
+                return encode(o)
         if hasattr(o, "__html__"):
             return str(o.__html__())
         return json.JSONEncoder.default(self, o)
@@ -359,13 +446,12 @@ class JSONEncoder(json.JSONEncoder):
 
 def htmlsafe_json_dump(obj, **kwargs):
     kwargs.setdefault("cls", JSONEncoder)
-    rv = (
-        json.dumps(obj, **kwargs)
-        .replace("<", "\\u003c")
-        .replace(">", "\\u003e")
-        .replace("&", "\\u0026")
-        .replace("'", "\\u0027")
-    )
+    rv = json.dumps(obj, **kwargs)
+    # Only pay for a copy of the (possibly large) dump when there is
+    # something to escape.
+    for char, escape in _htmlsafe_json_escapes:
+        if char in rv:
+            rv = rv.replace(char, escape)
     if not _slash_escape:
         rv = rv.replace("\\/", "/")
     return rv
@@ -375,19 +461,37 @@ def tojson_filter(obj, **kwargs):
     return Markup(htmlsafe_json_dump(obj, **kwargs))
 
 
+@lru_cache(maxsize=8192)
+def _parse_url(value):
+    u = url_parse(value)
+    i = u.to_iri_tuple()
+    return (
+        str(u),
+        i.host,
+        u.ascii_host,
+        u.port,
+        i.path,
+        u.query,
+        i.fragment,
+        u.scheme,
+    )
+
+
 class Url:
+    cache_clear = staticmethod(_parse_url.cache_clear)
+
     def __init__(self, value):
         self.url = value
-        u = url_parse(value)
-        i = u.to_iri_tuple()
-        self.ascii_url = str(u)
-        self.host = i.host
-        self.ascii_host = u.ascii_host
-        self.port = u.port
-        self.path = i.path
-        self.query = u.query
-        self.anchor = i.fragment
-        self.scheme = u.scheme
+        (
+            self.ascii_url,
+            self.host,
+            self.ascii_host,
+            self.port,
+            self.path,
+            self.query,
+            self.anchor,
+            self.scheme,
+        ) = _parse_url(value)
 
     def __unicode__(self):
         return self.url
@@ -429,7 +533,12 @@ def prune_file_and_folder(name, base):
 
 
 def sort_normalize_string(s):
-    return unicodedata.normalize("NFD", str(s).lower().strip())
+    return _sort_normalize_str(str(s))
+
+
+@lru_cache(maxsize=16384, typed=True)
+def _sort_normalize_str(s):
+    return unicodedata.normalize("NFD", s.casefold().strip())
 
 
 def get_dependent_url(url_path, suffix, ext=None):
@@ -491,12 +600,9 @@ def portable_popen(cmd, *args, **kwargs):
 def is_valid_id(value):
     if value == "":
         return True
-    return (
-        "/" not in value
-        and value.strip() == value
-        and value.split() == [value]
-        and not value.startswith(".")
-    )
+    # NB: ``value.split() == [value]`` also rules out leading and trailing
+    # whitespace.
+    return "/" not in value and value[0] != "." and value.split() == [value]
 
 
 def secure_url(url):
@@ -569,28 +675,17 @@ def get_relative_path(source, target):
         source = source.relative_to("/")
         target = target.relative_to("/")
 
-    # is the source an ancestor of the target?
-    try:
-        return target.relative_to(source)
-    except ValueError:
-        pass
-
-    # even if it isn't, one of the source's ancestors might be
-    # (and if not, the root will be the common ancestor)
-    distance = PurePosixPath(".")
-    for ancestor in source.parents:
-        distance /= ".."
-
-        try:
-            relpath = target.relative_to(ancestor)
-        except ValueError:
-            continue
-        else:
-            # prepend the distance to the common ancestor
-            return distance / relpath
-    # We should never get here.  (The last ancestor in source.parents will
-    # be '.' — target.relative_to('.') will always succeed.)
-    raise AssertionError("This should not happen")
+    # find the common ancestor, then climb up to it from the source and
+    # descend from there to the target
+    source_parts = source.parts
+    target_parts = target.parts
+    common = 0
+    max_common = min(len(source_parts), len(target_parts))
+    while common < max_common and source_parts[common] == target_parts[common]:
+        common += 1
+    return PurePosixPath(
+        *(("..",) * (len(source_parts) - common) + target_parts[common:])
+    )
 
 
 def profile_func(func):
@@ -622,12 +717,8 @@ def deg_to_dms(deg):
 def format_lat_long(lat=None, long=None, secs=True):
     def _format(value, sign):
         d, m, sd = deg_to_dms(value)
-        return "%d° %d′ %s%s" % (
-            abs(d),
-            abs(m),
-            secs and ("%d″ " % abs(sd)) or "",
-            sign[d < 0],
-        )
+        s_part = f"{int(abs(sd))}″ " if secs else ""
+        return f"{abs(d)}° {abs(m)}′ {s_part}{sign[d < 0]}"
 
     rv = []
     if lat is not None:
@@ -655,6 +746,7 @@ def get_cache_dir():
 class URLBuilder:
     def __init__(self):
         self.items = []
+        self._has_dot = False
 
     def append(self, item):
         if item is None:
@@ -662,17 +754,17 @@ class URLBuilder:
         item = str(item).strip("/")
         if item:
             self.items.append(item)
+            if "." in item:
+                self._has_dot = True
 
     def get_url(self, trailing_slash=None):
+        if not self.items:
+            return "/"
         url = "/" + "/".join(self.items)
         if trailing_slash is not None and not trailing_slash:
             return url
-        if url == "/":
+        if trailing_slash is None and self._has_dot:
             return url
-        if trailing_slash is None:
-            _, last = url.split("/", 1)
-            if "." in last:
-                return url
         return url + "/"
 
 
@@ -721,6 +813,14 @@ def unique_everseen(seq: Iterable[_H]) -> Iterable[_H]:
             yield val
 
 
+def unique_list(seq: Iterable[_H]) -> list[_H]:
+    """Return a list of the unique items in iterable, preserving order.
+
+    This is equivalent to ``list(unique_everseen(seq))``, but faster.
+    """
+    return list(dict.fromkeys(seq))
+
+
 class DeprecatedWarning(DeprecationWarning):
     """Warning category issued by our ``deprecated`` decorator."""
 
@@ -734,26 +834,38 @@ class DeprecatedWarning(DeprecationWarning):
         self.reason = reason
         self.version = version
 
+        message = f"{name!r} is deprecated"
+        if reason:
+            message += f" ({reason})"
+        if version:
+            message += f" since version {version}"
+        self._message = message
+
     def __str__(self) -> str:
-        message = f"{self.name!r} is deprecated"
-        if self.reason:
-            message += f" ({self.reason})"
-        if self.version:
-            message += f" since version {self.version}"
-        return message
+        return self._message
 
 
 _F = TypeVar("_F", bound=Callable[..., Any])
 
 
-@dataclass
 class _Deprecate:
     """A decorator to mark callables as deprecated."""
 
-    name: str | None = None
-    reason: str | None = None
-    version: str | None = None
-    stacklevel: int = 1
+    __slots__ = ("name", "reason", "version", "stacklevel", "suppress_nested")
+
+    def __init__(
+        self,
+        name: str | None = None,
+        reason: str | None = None,
+        version: str | None = None,
+        stacklevel: int = 1,
+        suppress_nested: bool = True,
+    ):
+        self.name = name
+        self.reason = reason
+        self.version = version
+        self.stacklevel = stacklevel
+        self.suppress_nested = suppress_nested
 
     def __call__(self, wrapped: _F) -> _F:
         if not callable(wrapped):
@@ -761,13 +873,24 @@ class _Deprecate:
 
         name = self.name or wrapped.__name__
         message = DeprecatedWarning(name, self.reason, self.version)
+        stacklevel = self.stacklevel + 1
+
+        if self.suppress_nested:
 
-        @wraps(wrapped)
-        def wrapper(*args: Any, **kwargs: Any) -> Any:
-            warnings.warn(message, stacklevel=self.stacklevel + 1)
-            with warnings.catch_warnings():
-                # ignore any of our own custom warnings generated by wrapped callable
-                warnings.simplefilter("ignore", category=DeprecatedWarning)
+            @wraps(wrapped)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                warnings.warn(message, stacklevel=stacklevel)
+                with warnings.catch_warnings():
+                    # ignore any of our own custom warnings generated by wrapped
+                    # callable
+                    warnings.simplefilter("ignore", category=DeprecatedWarning)
+                    return wrapped(*args, **kwargs)
+
+        else:
+
+            @wraps(wrapped)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                warnings.warn(message, stacklevel=stacklevel)
                 return wrapped(*args, **kwargs)
 
         return wrapper  # type: ignore[return-value]
@@ -781,6 +904,7 @@ def deprecated(
     reason: str | None = ...,
     version: str | None = ...,
     stacklevel: int = ...,
+    suppress_nested: bool = ...,
 ) -> Callable[..., Any]:
     ...
 
@@ -792,6 +916,7 @@ def deprecated(
     name: str | None = ...,
     version: str | None = ...,
     stacklevel: int = ...,
+    suppress_nested: bool = ...,
 ) -> _Deprecate:
     ...
 
@@ -803,6 +928,7 @@ def deprecated(
     reason: str | None = ...,
     version: str | None = ...,
     stacklevel: int = ...,
+    suppress_nested: bool = ...,
 ) -> _Deprecate:
     ...
 
@@ -829,6 +955,13 @@ def deprecated(*args: Any, **kwargs: Any) -> _F | _Deprecate:
     reported for the immediate caller of the decorated object.  Higher values
     attribute the warning callers further back in the stack.
 
+    By default, any of our own deprecation warnings issued while the decorated
+    callable runs are suppressed, so that only the outermost deprecated call is
+    reported.  This costs a ``warnings.catch_warnings()`` block on every call.
+    Passing ``suppress_nested=False`` skips that, which may be worthwhile for
+    deprecated callables that are called often and do not themselves call other
+    deprecated code.
+
     """
     if len(args) > 1:
         raise TypeError("deprecated accepts a maximum of one positional parameter")
@@ -1,7 +1,6 @@
 import os
 import queue
 import time
-from collections import OrderedDict
 from itertools import zip_longest
 
 import click
@@ -12,6 +11,7 @@ from watchdog.observers import Observer
 from watchdog.observers.polling import PollingObserver
 
 from lektor.utils import get_cache_dir
+from lektor.utils import unique_list
 
 
 class EventHandler(FileSystemEventHandler):
@@ -33,11 +33,6 @@ def _fullname(cls):
     return f"{cls.__module__}.{cls.__qualname__}"
 
 
-def _unique_everseen(seq):
-    """Return the unique elements in sequence, preserving order."""
-    return OrderedDict.fromkeys(seq).keys()
-
-
 class BasicWatcher:
     def __init__(self, paths, observer_classes=(Observer, PollingObserver)):
         self.event_handler = EventHandler()
@@ -50,7 +45,7 @@ class BasicWatcher:
         # observer class more than once. (This also simplifies the logic
         # for presenting sensible warning messages about broken
         # observers.)
-        observer_classes = list(_unique_everseen(self.observer_classes))
+        observer_classes = unique_list(self.observer_classes)
         for observer_class, next_observer_class in zip_longest(
             observer_classes, observer_classes[1:]
         ):
@@ -1,18 +1,34 @@
+import os
+import uuid
 import warnings
+from collections import OrderedDict
 from contextlib import contextmanager
+from datetime import datetime
 from itertools import islice
 
 import pytest
+from jinja2 import Undefined
 
 from lektor.utils import build_url
+from lektor.utils import decode_flat_data
 from lektor.utils import deprecated
+from lektor.utils import format_lat_long
+from lektor.utils import htmlsafe_json_dump
 from lektor.utils import is_path_child_of
+from lektor.utils import is_valid_id
 from lektor.utils import join_path
+from lektor.utils import locate_executable
 from lektor.utils import magic_split_ext
 from lektor.utils import make_relative_url
+from lektor.utils import merge
 from lektor.utils import parse_path
+from lektor.utils import resolve_dotted_value
+from lektor.utils import secure_filename
 from lektor.utils import slugify
+from lektor.utils import sort_normalize_string
 from lektor.utils import unique_everseen
+from lektor.utils import unique_list
+from lektor.utils import Url
 
 
 def test_join_path():
@@ -58,6 +74,24 @@ def test_is_path_child_of():
     assert not is_path_child_of("a/b@foo/bar", "a/b@bar")
 
 
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("", True),
+        ("a", True),
+        ("a.b", True),
+        (".x", False),
+        ("a/b", False),
+        (" a", False),
+        ("a ", False),
+        ("a b", False),
+        ("a\tb", False),
+    ],
+)
+def test_is_valid_id(value, expected):
+    assert is_valid_id(value) is expected
+
+
 def test_magic_split_ext():
 
     assert magic_split_ext("wow") == ("wow", "")
@@ -75,6 +109,38 @@ def test_slugify():
     assert slugify("slashed/slug") == "slashed/slug"
 
 
+@pytest.mark.parametrize(
+    "filename, expected",
+    [
+        # ASCII fast path
+        ("Foo-Bar.JPG", "foo-bar.JPG"),
+        ("Foo-Bar", "foo-bar"),
+        ("a1-B2.tar.gz", "a1-b2.tar.gz"),
+        # slugify path
+        ("a_b", "a-b"),
+        ("a--b", "a-b"),
+        ("-a", "a"),
+        ("a-", "a"),
+        ("Șö prĕtty.png", "so-pretty.png"),
+        ("dir/sub\\name.txt", "dir-sub-name.txt"),
+        # fallback
+        ("", "file"),
+        ("???", "file"),
+    ],
+)
+def test_secure_filename(filename, expected):
+    assert secure_filename(filename) == expected
+
+
+@pytest.mark.parametrize("basename", ["Foo-Bar", "a1-B2", "x", "ABC-123-def"])
+def test_secure_filename_fast_path_agrees_with_slugify(basename):
+    assert secure_filename(basename) == slugify(basename)
+
+
+def test_secure_filename_fallback_name():
+    assert secure_filename("???", fallback_name="upload") == "upload"
+
+
 def test_url_builder():
 
     assert build_url([]) == "/"
@@ -83,6 +149,9 @@ def test_url_builder():
     assert build_url(["a", "b/c.html"]) == "/a/b/c.html"
     assert build_url(["a", "b/c.html"], trailing_slash=True) == "/a/b/c.html/"
     assert build_url(["a", None, "b", "", "c"]) == "/a/b/c/"
+    # a dot in any segment (not just the last) suppresses the trailing slash
+    assert build_url(["a.b", "c"]) == "/a.b/c"
+    assert build_url(["a.b", "c"], trailing_slash=True) == "/a.b/c/"
 
 
 def test_parse_path():
@@ -96,6 +165,133 @@ def test_parse_path():
     assert parse_path("/foo/bar/../stuff") == ["foo", "stuff"]
 
 
+def test_decode_flat_data():
+
+    assert decode_flat_data([]) == {}
+    assert decode_flat_data([("a", 1), ("b.c", 2), ("b.d", 3)]) == {
+        "a": 1,
+        "b": {"c": 2, "d": 3},
+    }
+    assert decode_flat_data([("a.1", "y"), ("a.0", "x")]) == {"a": ["x", "y"]}
+    assert decode_flat_data([("a.0.b", 1), ("a.1.b", 2)]) == {"a": [{"b": 1}, {"b": 2}]}
+    # a key with both a value and integer-indexed children: the value is
+    # dropped, but the children are kept intact
+    assert decode_flat_data([("c", 9), ("c.2", 7)]) == {"c": {2: 7}}
+
+
+def test_decode_flat_data_deeply_nested():
+    rv = decode_flat_data([(".".join(["x"] * 5000), 42)])
+    for _ in range(4999):
+        rv = rv["x"]
+    assert rv == {"x": 42}
+
+
+def test_merge():
+
+    assert merge(None, 1) == 1
+    assert merge(1, None) == 1
+    assert merge(1, 2) == 1
+    assert merge([None, 1, 2], [3, 4]) == [3, 1, 2]
+    assert merge({"a": {"b": None}}, {"a": {"b": 1, "c": 2}, "d": None}) == {
+        "a": {"b": 1, "c": 2},
+        "d": None,
+    }
+
+    # a container shared between two keys is merged in key order, so the
+    # first merge into it wins
+    shared = {"k": None}
+    assert merge({"x": shared, "y": shared}, {"x": {"k": 1}, "y": {"k": 2}}) == {
+        "x": {"k": 1},
+        "y": {"k": 1},
+    }
+
+
+@pytest.mark.parametrize(
+    "dotted_path, expected",
+    [
+        ("a", {"b": [1, {2: "x"}]}),
+        ("a.b.0", 1),
+        ("a.b.1.2", "x"),
+        ("a.b.2", None),
+        ("a.b.x", None),
+        ("a.c", None),
+        ("a.b.0.c", None),
+    ],
+)
+def test_resolve_dotted_value(dotted_path, expected):
+    obj = OrderedDict(a=OrderedDict(b=[1, {2: "x"}]))
+    assert resolve_dotted_value(obj, dotted_path) == expected
+
+
+@pytest.mark.parametrize(
+    "obj, expected",
+    [
+        (
+            "<a href='x'>&</a>",
+            r'"\u003ca href=\u0027x\u0027\u003e\u0026\u003c/a\u003e"',
+        ),
+        ({"a": [1, "b/c"]}, '{"a": [1, "b/c"]}'),
+    ],
+)
+def test_htmlsafe_json_dump(obj, expected):
+    assert htmlsafe_json_dump(obj) == expected
+
+
+@pytest.mark.skipif(os.name == "nt", reason="POSIX executable permissions")
+def test_locate_executable_sees_path_changes(tmp_path, monkeypatch):
+    bindir = tmp_path / "bin"
+    bindir.mkdir()
+    exe = bindir / "lektor-test-exe"
+    exe.write_text("#!/bin/sh\n")
+    exe.chmod(0o755)
+
+    monkeypatch.setenv("PATH", str(tmp_path))
+    assert locate_executable("lektor-test-exe") is None
+    monkeypatch.setenv("PATH", str(bindir))
+    assert locate_executable("lektor-test-exe") == str(exe)
+
+
+class _DatetimeSubclass(datetime):
+    pass
+
+
+class _HasHtml:
+    def __html__(self):
+        return "<b>x</b>"
+
+
+@pytest.mark.parametrize(
+    "obj, expected",
+    [
+        (datetime(2020, 1, 2, 3, 4, 5), '"Thu, 02 Jan 2020 03:04:05 GMT"'),
+        (_DatetimeSubclass(2020, 1, 2, 3, 4, 5), '"Thu, 02 Jan 2020 03:04:05 GMT"'),
+        (uuid.UUID(int=1), '"00000000-0000-0000-0000-000000000001"'),
+        (Undefined(), "null"),
+        (_HasHtml(), r'"\u003cb\u003ex\u003c/b\u003e"'),
+    ],
+)
+def test_htmlsafe_json_dump_extra_types(obj, expected):
+    assert htmlsafe_json_dump(obj) == expected
+
+
+def test_htmlsafe_json_dump_unknown_type():
+    with pytest.raises(TypeError):
+        htmlsafe_json_dump(object())
+
+
+def test_url():
+    value = "https://bücher.example/pfad?q=1#frag"
+    url = Url(value)
+    assert url.url == value
+    assert url.host == "bücher.example"
+    assert url.ascii_host == "xn--bcher-kva.example"
+    assert (url.path, url.query, url.anchor) == ("/pfad", "q=1", "frag")
+
+    assert vars(Url(value)) == vars(url)
+    Url.cache_clear()
+    assert vars(Url(value)) == vars(url)
+
+
 @pytest.mark.parametrize(
     "source, target, expected",
     [
@@ -134,6 +330,36 @@ def test_make_relative_url_relative_source_absolute_target():
         make_relative_url("rel/a/tive/", "/abs/o/lute")
 
 
+def test_sort_normalize_string():
+
+    assert sort_normalize_string(" Foo ") == "foo"
+    assert sort_normalize_string("Straße") == sort_normalize_string("STRASSE")
+    assert sort_normalize_string("\u00e9") == sort_normalize_string("e\u0301")
+    # non-str values are normalized via str(), without sharing cache entries
+    # between values that merely compare equal
+    assert sort_normalize_string(True) == "true"
+    assert sort_normalize_string(1.0) == "1.0"
+    assert sort_normalize_string(1) == "1"
+    assert sort_normalize_string(["A"]) == "['a']"
+
+
+@pytest.mark.parametrize(
+    "kwargs, expected",
+    [
+        ({}, ""),
+        ({"lat": -33.8568, "long": 151.2153}, "33° 51′ 24″ S, 151° 12′ 55″ E"),
+        ({"lat": -33.8568, "long": 151.2153, "secs": False}, "33° 51′ S, 151° 12′ E"),
+        ({"lat": 0.0}, "0° 0′ 0″ N"),
+        ({"long": -(1 + 59.99 / 3600)}, "1° 0′ 59″ W"),
+        # seconds are truncated, not rounded
+        ({"lat": 10 + 59.9999 / 3600}, "10° 0′ 59″ N"),
+        ({"lat": 10 + 0.0001 / 3600}, "10° 0′ 0″ N"),
+    ],
+)
+def test_format_lat_long(kwargs, expected):
+    assert format_lat_long(**kwargs) == expected
+
+
 @pytest.mark.parametrize(
     "seq, expected",
     [
@@ -146,6 +372,18 @@ def test_unique_everseen(seq, expected):
     assert tuple(unique_everseen(seq)) == expected
 
 
+@pytest.mark.parametrize(
+    "seq, expected",
+    [
+        (iter(()), []),
+        ((2, 1, 1, 2, 1), [2, 1]),
+        ((1, 2, 1, 2, 1), [1, 2]),
+    ],
+)
+def test_unique_list(seq, expected):
+    assert unique_list(seq) == expected
+
+
 @contextmanager
 def _local_deprecated_call(match=None):
     """Like pytest.deprecated_call, but also check that all warnings
@@ -209,6 +447,23 @@ def test_deprecated_classmethod():
     assert len([w.message for w in warnings]) == 1
 
 
+def test_deprecated_suppress_nested_false():
+    @deprecated
+    def f():
+        return 42
+
+    @deprecated(suppress_nested=False)
+    def g():
+        return f()
+
+    with _local_deprecated_call() as warnings:
+        assert g() == 42
+    assert [str(w.message) for w in warnings] == [
+        "'g' is deprecated",
+        "'f' is deprecated",
+    ]
+
+
 def test_deprecated_raises_type_error():
     with pytest.raises(TypeError):
         deprecated(0)